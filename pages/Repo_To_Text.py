@@ -1,44 +1,88 @@
 import streamlit as st
 import git
 import os
+import shutil
 import tempfile
-import json
-from io import BytesIO
+import orjson
+import concurrent.futures
+from concurrent.futures import ThreadPoolExecutor
 from st_copy_to_clipboard import st_copy_to_clipboard
 
 
-# Cache the function to preserve data across reruns
-@st.cache_data
+# Shallow clone: we only read the working tree, so history and tags are wasted bytes
 def clone_repo(repo_url, temp_dir):
     try:
-        git.Repo.clone_from(repo_url, temp_dir)
+        git.Repo.clone_from(
+            repo_url,
+            temp_dir,
+            multi_options=["--depth=1", "--single-branch", "--no-tags"],
+        )
         return True
     except git.GitCommandError:
         return False
 
 
-# Cache the function to preserve data across reruns
-@st.cache_data
-def extract_files(temp_dir, file_types):
-    extracted_content = {}
-    for root, dirs, files in os.walk(temp_dir):
-        for file in files:
-            file_path = os.path.join(root, file)
-            relative_path = os.path.relpath(file_path, temp_dir)
-
-            # Check if the file matches the selected types
-            if (
-                ("md" in file_types and file.endswith(".md"))
-                or ("sol" in file_types and file.endswith(".sol"))
-                or (
-                    "json" in file_types
-                    and file.endswith(".json")
-                    and "artifacts" in relative_path.split(os.sep)
-                )
-            ):
-                with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
-                    extracted_content[relative_path] = f.read()
-    return extracted_content
+# Directories that never contain files worth extracting
+IGNORED_DIRS = frozenset({".git"})
+
+
+# Walk the tree with os.scandir so file/dir checks reuse the cached DirEntry
+def iter_files(path, temp_dir):
+    with os.scandir(path) as it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                if entry.name in IGNORED_DIRS:
+                    continue
+                yield from iter_files(entry.path, temp_dir)
+            elif entry.is_file(follow_symlinks=False):
+                yield entry, os.path.relpath(entry.path, temp_dir)
+
+
+# Read a file as bytes and decode it once
+def read_file(file_path):
+    with open(file_path, "rb") as f:
+        # Hint the kernel to read ahead, since the whole file is read in one go
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        data = f.read()
+    return data.decode("utf-8", "ignore")
+
+
+def extract_files(temp_dir, file_types, max_size=None):
+    suffixes = {f".{file_type}" for file_type in file_types}
+    artifacts_dir = f"{os.sep}artifacts{os.sep}"
+    paths = []
+    relative_paths = []
+    for entry, relative_path in iter_files(temp_dir, temp_dir):
+        # Check if the file matches the selected types
+        ext = os.path.splitext(entry.name)[1]
+        if ext not in suffixes:
+            continue
+        # JSON is only useful from build artifacts (ABIs)
+        if ext == ".json" and artifacts_dir not in f"{os.sep}{relative_path}":
+            continue
+
+        # Skip oversized (usually generated) files before reading them
+        if max_size and entry.stat(follow_symlinks=False).st_size > max_size:
+            continue
+
+        paths.append(entry.path)
+        relative_paths.append(relative_path)
+
+    # Reads are IO-bound, so overlap them; map keeps the walk order
+    with ThreadPoolExecutor(max_workers=32) as executor:
+        return dict(zip(relative_paths, executor.map(read_file, paths)))
+
+
+# Clone and extract a single repo; runs in a worker thread
+def clone_and_extract(repo_url, file_types, max_size=None):
+    temp_dir = tempfile.mkdtemp()
+    try:
+        if not clone_repo(repo_url, temp_dir):
+            return repo_url, None
+        return repo_url, extract_files(temp_dir, file_types, max_size)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
 
 
 # Function to get a snippet of text
@@ -70,6 +114,12 @@ file_types = st.multiselect(
     default=["md", "sol", "json"],
 )
 
+# Files above this size are skipped (0 means no limit)
+max_file_size_mb = st.number_input(
+    "Skip files larger than (MB, 0 = no limit):", min_value=0, value=0
+)
+max_file_size = max_file_size_mb * 1024 * 1024
+
 # Add this near the top of your script, after the imports
 if "previous_repo_urls" not in st.session_state:
     st.session_state.previous_repo_urls = ""
@@ -78,49 +128,70 @@ if "previous_repo_urls" not in st.session_state:
 if repo_urls != st.session_state.previous_repo_urls:
     st.cache_data.clear()
     st.session_state.all_extracted_content = {}
+    st.session_state.json_bytes = None
     st.session_state.previous_repo_urls = repo_urls
 
 # Use session state to preserve data across reruns
 if "all_extracted_content" not in st.session_state:
     st.session_state.all_extracted_content = {}
+    st.session_state.json_bytes = None
 
 if st.button("Process Repositories"):
-    repo_list = repo_urls.split("\n")
+    repo_list = [url.strip() for url in repo_urls.split("\n") if url.strip()]
     progress_bar = st.progress(0)
     status_text = st.empty()
 
-    for i, repo_url in enumerate(repo_list):
-        repo_url = repo_url.strip()
-        if repo_url:
-            with tempfile.TemporaryDirectory() as temp_dir:
-                status_text.text(f"Scraping {repo_url} ({i+1}/{len(repo_list)})")
-                if clone_repo(repo_url, temp_dir):
-                    extracted_content = extract_files(temp_dir, file_types)
-                    repo_name = repo_url.split("/")[-1].replace(".git", "")
-                    st.session_state.all_extracted_content[repo_name] = (
-                        extracted_content
-                    )
-                else:
+    # Clones are network-bound, so run them concurrently
+    if repo_list:
+        with ThreadPoolExecutor(max_workers=min(8, len(repo_list))) as executor:
+            futures = [
+                executor.submit(clone_and_extract, repo_url, file_types, max_file_size)
+                for repo_url in repo_list
+            ]
+            for i, future in enumerate(concurrent.futures.as_completed(futures)):
+                repo_url, extracted_content = future.result()
+                status_text.text(f"Scraped {repo_url} ({i+1}/{len(repo_list)})")
+                if extracted_content is None:
                     st.error(f"Failed to clone: {repo_url}")
-        progress_bar.progress((i + 1) / len(repo_list))
+                progress_bar.progress((i + 1) / len(repo_list))
+
+        # Store results in input order so the downloads and their file name
+        # don't depend on which clone finished first
+        for future in futures:
+            repo_url, extracted_content = future.result()
+            if extracted_content is not None:
+                repo_name = repo_url.split("/")[-1].replace(".git", "")
+                st.session_state.all_extracted_content[repo_name] = extracted_content
+
+    # Serialize once per processing run rather than on every rerun; kept per
+    # session so other users' results never leak into this download
+    st.session_state.json_bytes = orjson.dumps(
+        st.session_state.all_extracted_content, option=orjson.OPT_INDENT_2
+    )
 
     status_text.text("All repositories processed!")
 
 if st.session_state.all_extracted_content:
     st.subheader("Extracted Content")
     with st.spinner("Processing content..."):
-        text_content = ""
-        display_content = ""
+        # Collect parts and join once; += on a growing string is quadratic
+        text_parts = []
+        display_parts = []
         repo_names = list(st.session_state.all_extracted_content.keys())
 
         for repo, files in st.session_state.all_extracted_content.items():
-            text_content += f"\n\n{'=' * 20} {repo} {'=' * 20}\n\n"
-            display_content += f"\n\n{'=' * 20} {repo} {'=' * 20}\n\n"
+            repo_header = f"\n\n{'=' * 20} {repo} {'=' * 20}\n\n"
+            text_parts.append(repo_header)
+            display_parts.append(repo_header)
             for file_path, content in files.items():
-                text_content += f"\n\n{'=' * 20} {file_path} {'=' * 20}\n\n"
-                text_content += content
-                display_content += f"\n\n{'=' * 20} {file_path} {'=' * 20}\n\n"
-                display_content += get_snippet(content)
+                file_header = f"\n\n{'=' * 20} {file_path} {'=' * 20}\n\n"
+                text_parts.append(file_header)
+                text_parts.append(content)
+                display_parts.append(file_header)
+                display_parts.append(get_snippet(content))
+
+        text_content = "".join(text_parts)
+        display_content = "".join(display_parts)
 
         # Generate file names based on the number of repos
         if len(repo_names) == 1:
@@ -129,41 +200,34 @@ if st.session_state.all_extracted_content:
             file_name = "_".join(repo_names)
 
         # Download as text file
-        text_file = BytesIO(text_content.encode())
         st.download_button(
             label="Download as Text File",
-            data=text_file,
+            data=text_content,
             file_name=f"{file_name}.txt",
             mime="text/plain",
         )
 
         # Download as JSON
-        json_content = json.dumps(
-            {
-                repo: {file_path: content for file_path, content in files.items()}
-                for repo, files in st.session_state.all_extracted_content.items()
-            },
-            indent=2,
-        )
-        json_file = BytesIO(json_content.encode())
         st.download_button(
             label="Download as JSON",
-            data=json_file,
+            data=st.session_state.json_bytes,
             file_name=f"{file_name}.json",
             mime="application/json",
         )
 
-        # Copy to clipboard
-        if st_copy_to_clipboard(text_content):
-            try:
-                st.success("Text copied to clipboard!")
-            except Exception as e:
-                st.error(
-                    "The text is too large to copy to clipboard. Please download the text file instead."
-                )
-                st.info(
-                    "Click the 'Download as Text File' button above to save the content."
-                )
+        # Copy to clipboard; the helper embeds the whole text in the page, so it
+        # is only rendered on request. Large texts should be downloaded instead.
+        if st.checkbox("Show copy to clipboard button"):
+            if st_copy_to_clipboard(text_content):
+                try:
+                    st.success("Text copied to clipboard!")
+                except Exception as e:
+                    st.error(
+                        "The text is too large to copy to clipboard. Please download the text file instead."
+                    )
+                    st.info(
+                        "Click the 'Download as Text File' button above to save the content."
+                    )
 
         # Display snippet
         st.write(f"""The text content is {len(text_content)} words long""")
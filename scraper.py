@@ -1,31 +1,93 @@
 import streamlit as st
 import requests
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin, urlparse, urlunparse
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import lxml.html
+from lxml import etree
+from urllib.parse import urljoin, urlparse, urlsplit, urlunsplit
+import posixpath
 import pandas as pd
 import time
 import re
 from st_copy_to_clipboard import st_copy_to_clipboard
-import chardet
 import fitz
-import json
+import orjson
+import threading
+from cachetools import TTLCache
+import functools
+import hashlib
+from collections import deque
 import concurrent.futures
 from concurrent.futures import ThreadPoolExecutor
 
+# Optional: only needed for near-duplicate removal
+try:
+    from datasketch import MinHash, MinHashLSH
+except ImportError:
+    MinHash = MinHashLSH = None
+
 # Add this near the top of the script
-IGNORED_SUFFIXES = [
+IGNORED_SUFFIXES = (
     ".rst",
     ".png",
     ".gif",
     ".jpeg",
     ".jpg",
-]  # Add more suffixes here as needed
+)  # Add more suffixes here as needed (a tuple, so str.endswith can take it)
+
+# Default number of pages fetched concurrently while crawling
+CRAWL_CONCURRENCY = 16
+
+# Only responses of these content types are downloaded and scraped
+SCRAPED_CONTENT_TYPES = ("text/", "application/xhtml", "application/pdf")
+
+# Response bodies are truncated beyond this size
+MAX_RESPONSE_BYTES = 20 * 1024 * 1024
 
+# A <meta charset=...> or http-equiv Content-Type declaration near the top of a page
+META_CHARSET_PATTERN = re.compile(rb"<meta[^>]+charset", re.IGNORECASE)
 
-@st.cache_data
-def crawl_and_scrape(root_domain, max_depth=5, max_consecutive_backtrack=20):
+_thread_local = threading.local()
+
+
+# One requests.Session per worker thread so connections are kept alive
+def get_session():
+    if not hasattr(_thread_local, "session"):
+        session = requests.Session()
+        retry = Retry(
+            total=3,
+            backoff_factor=0.3,
+            status_forcelist=[429, 500, 502, 503, 504],
+        )
+        adapter = HTTPAdapter(max_retries=retry)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        _thread_local.session = session
+    return _thread_local.session
+
+
+# Pure function of the URL string; the same links repeat on every page of a
+# docs site, so memoize it
+@functools.lru_cache(maxsize=100_000)
+def normalize_url(url):
+    # Resolve "." / ".." and duplicate slashes in C via posixpath.normpath; the
+    # trailing slash and the fragment are dropped so "/docs/" and "/docs#x"
+    # both map to "/docs"
+    parsed = urlsplit(url)
+    path = posixpath.normpath("/" + parsed.path.lstrip("/")).rstrip("/")
+    return urlunsplit((parsed.scheme, parsed.netloc, path, parsed.query, ""))
+
+
+# Not cached itself: st.session_state.df keeps the result across reruns, and a
+# re-scrape should revalidate pages through the page cache
+def crawl_and_scrape(
+    root_domain, max_depth=5, concurrency=CRAWL_CONCURRENCY, scrape_pdfs=True
+):
+    page_cache = get_page_cache()
     visited_urls = set()
-    queue = [(root_domain, [root_domain], 0)]  # (url, breadcrumb, depth)
+    seen_urls = set()  # visited or already queued
+    seen_bodies = set()  # digests of page bodies already kept
+    queue = deque([(root_domain, 0)])  # (url, depth)
     data = []
     failed_pages = []
 
@@ -39,178 +101,265 @@ def crawl_and_scrape(root_domain, max_depth=5, max_consecutive_backtrack=20):
     base_url = f"{parsed_root.scheme}://{parsed_root.netloc}"
     root_path = parsed_root.path.rstrip("/")
 
-    # Create a regex pattern to match URLs that start with the base_url and contain the root_path
-    url_pattern = re.compile(f"^{re.escape(base_url)}{re.escape(root_path)}(/|$)")
-
-    def normalize_url(url):
-        parsed = urlparse(url)
-        path = parsed.path.split("/")
-        normalized_path = []
-        for segment in path:
-            if segment == "." or segment == "":
+    # URLs are in scope if they are the root itself or live under it; plain
+    # str.startswith is much cheaper than a regex for this
+    scope_prefix = f"{base_url}{root_path}"
+    scope_children = (f"{scope_prefix}/", f"{scope_prefix}?")
+
+    def in_scope(url):
+        return url == scope_prefix or url.startswith(scope_children)
+
+    pending = {}  # future -> (url, depth)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        while queue or pending:
+            # Keep the pool busy with URLs from the frontier
+            while queue and len(pending) < concurrency:
+                url, depth = queue.popleft()
+
+                # Normalize the URL; this also removes the fragment
+                url_without_fragment = normalize_url(url)
+
+                # Check if the URL should be ignored based on its suffix
+                if url_without_fragment.endswith(IGNORED_SUFFIXES):
+                    continue
+
+                if (
+                    not in_scope(url_without_fragment)
+                    or url_without_fragment in visited_urls
+                ):
+                    continue
+
+                visited_urls.add(url_without_fragment)
+                seen_urls.add(url_without_fragment)
+
+                # Update counter and current URL
+                counter += 1
+                counter_placeholder.text(f"Pages crawled: {counter}")
+                url_placeholder.text(f"Current page: {url_without_fragment}")
+
+                # One request per page: text and links come from the same response
+                future = executor.submit(
+                    get_page_text, url_without_fragment, scrape_pdfs, page_cache
+                )
+                pending[future] = (url_without_fragment, depth)
+
+            if not pending:
                 continue
-            if segment == "..":
-                if normalized_path:
-                    normalized_path.pop()
-            else:
-                normalized_path.append(segment)
-        normalized_url = urlunparse(
-            (
-                parsed.scheme,
-                parsed.netloc,
-                "/".join(normalized_path),
-                parsed.params,
-                parsed.query,
-                "",
-            )
-        )
-        return normalized_url
 
-    consecutive_backtrack = 0
-    while queue:
-        url, breadcrumb, depth = queue.pop(0)
+            # Results are handled here, on the script thread, so visited_urls,
+            # queue and the Streamlit calls are never touched concurrently
+            done, _ = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            for future in done:
+                url_without_fragment, depth = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # Reported once in the "Failed Pages" expander after the crawl
+                    failed_pages.append(f"{url_without_fragment}: {str(e)}")
+                    continue
+
+                # Not a page we extract text from
+                if result is None:
+                    continue
+
+                page_text, hrefs = result
+
+                # Keep only the first page with a given body; comparing short
+                # digests is much cheaper than hashing the full text column.
+                # Links are still followed from duplicate pages.
+                body_digest = hashlib.blake2b(
+                    page_text.encode("utf-8"), digest_size=16
+                ).digest()
+                if body_digest not in seen_bodies:
+                    seen_bodies.add(body_digest)
+                    data.append((url_without_fragment, page_text))
+
+                # Only process links if we haven't reached the maximum depth
+                if depth < max_depth:
+                    for href in hrefs:
+                        absolute_url_without_fragment = normalize_url(
+                            urljoin(url_without_fragment, href)
+                        )
 
-        # Normalize the URL
-        url = normalize_url(url)
+                        # Skip links that are already visited or queued
+                        if absolute_url_without_fragment in seen_urls:
+                            continue
 
-        # Parse the URL
-        parsed_url = urlparse(url)
+                        if in_scope(
+                            absolute_url_without_fragment
+                        ) and not absolute_url_without_fragment.endswith(
+                            IGNORED_SUFFIXES
+                        ):
+                            seen_urls.add(absolute_url_without_fragment)
+                            queue.append((absolute_url_without_fragment, depth + 1))
 
-        # Remove the fragment from the URL
-        url_without_fragment = parsed_url._replace(fragment="").geturl()
+    # Create DataFrame; rows are already deduplicated by body digest
+    df = pd.DataFrame(data, columns=["full_weblink", "main_body_text"])
+    df.index.name = "index"
 
-        # Check if the URL should be ignored based on its suffix
-        if any(url_without_fragment.endswith(suffix) for suffix in IGNORED_SUFFIXES):
-            continue
+    return df, failed_pages
 
-        if (
-            not url_pattern.match(url_without_fragment)
-            or url_without_fragment in visited_urls
-        ):
-            continue
 
-        visited_urls.add(url_without_fragment)
+# Read a streamed response body, stopping once max_bytes have arrived
+def read_body(response, max_bytes=MAX_RESPONSE_BYTES):
+    chunks = []
+    size = 0
+    for chunk in response.iter_content(chunk_size=64 * 1024):
+        chunks.append(chunk)
+        size += len(chunk)
+        if size >= max_bytes:
+            break
+    return b"".join(chunks)[:max_bytes]
 
-        # Update counter and current URL
-        counter += 1
-        counter_placeholder.text(f"Pages crawled: {counter}")
-        url_placeholder.text(f"Current page: {url_without_fragment}")
 
-        try:
-            response = requests.get(url_without_fragment, timeout=10)
-            soup = BeautifulSoup(response.content, "html.parser")
-
-            # Only process links if we haven't reached the maximum depth
-            if depth < max_depth:
-                new_links = []
-                for link in soup.find_all("a", href=True):
-                    absolute_url = urljoin(url_without_fragment, link["href"])
-                    absolute_url = normalize_url(absolute_url)
-                    parsed_absolute_url = urlparse(absolute_url)
-                    absolute_url_without_fragment = parsed_absolute_url._replace(
-                        fragment=""
-                    ).geturl()
-
-                    if url_pattern.match(absolute_url_without_fragment) and not any(
-                        absolute_url_without_fragment.endswith(suffix)
-                        for suffix in IGNORED_SUFFIXES
-                    ):
-                        new_breadcrumb = breadcrumb + [absolute_url_without_fragment]
-                        new_links.append(
-                            (absolute_url_without_fragment, new_breadcrumb, depth + 1)
-                        )
+# Results of earlier fetches with the page's ETag/Last-Modified, shared across
+# reruns and sessions; bounded and expiring, and guarded by the lock since
+# crawl workers read and write it concurrently
+@st.cache_resource
+def get_page_cache():
+    return TTLCache(maxsize=10_000, ttl=3600), threading.Lock()
+
+
+# Returns (page_text, hrefs) so the crawl can follow links without refetching,
+# or None when the content type isn't something we extract text from. Pages
+# fetched before with an ETag/Last-Modified are requested conditionally, so
+# an unchanged page costs a 304 and no download or parse.
+def get_page_text(url, scrape_pdfs, page_cache):
+    cache, cache_lock = page_cache
+    key = (url, scrape_pdfs)
+    with cache_lock:
+        cached = cache.get(key)
+
+    headers = {}
+    if cached is not None:
+        etag, last_modified, _ = cached
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+
+    with get_session().get(url, headers=headers, timeout=10, stream=True) as response:
+        if response.status_code == 304 and cached is not None:
+            return cached[2]
+        response.raise_for_status()
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        result = fetch_page_text(response, scrape_pdfs)
+
+    if etag or last_modified:
+        with cache_lock:
+            cache[key] = (etag, last_modified, result)
+    return result
+
+
+def fetch_page_text(response, scrape_pdfs):
+    content_type = response.headers.get("Content-Type", "").lower()
 
-                if new_links:
-                    queue.extend(new_links)
-                    consecutive_backtrack = 0
-                else:
-                    # If no new links, backtrack
-                    consecutive_backtrack += 1
-                    if consecutive_backtrack > max_consecutive_backtrack:
-                        # Aggressive backtracking
-                        while (
-                            breadcrumb and len(breadcrumb) > 1
-                        ):  # Ensure we don't go beyond root
-                            breadcrumb.pop()
-                            depth -= 1
-                            if breadcrumb[-1] not in visited_urls:
-                                queue.insert(
-                                    0, (breadcrumb[-1], breadcrumb.copy(), depth)
-                                )
-                                consecutive_backtrack = 0
-                                break
-                    else:
-                        # Normal backtracking
-                        if breadcrumb:
-                            breadcrumb.pop()
-                            depth -= 1
-                            if breadcrumb:
-                                queue.insert(
-                                    0, (breadcrumb[-1], breadcrumb.copy(), depth)
-                                )
-
-        except requests.RequestException as e:
-            failed_pages.append(url_without_fragment)
-            st.warning(f"Failed to crawl {url_without_fragment}: {str(e)}")
-
-    # Scraping with concurrency
-    def scrape_url(url):
-        try:
-            page_text = get_page_text(url)
-            return url, page_text
-        except Exception as e:
-            failed_pages.append(url)
-            st.warning(f"Failed to scrape {url}: {str(e)}")
-            return None
-
-    with ThreadPoolExecutor(max_workers=2) as executor:
-        future_to_url = {executor.submit(scrape_url, url): url for url in visited_urls}
-        for future in concurrent.futures.as_completed(future_to_url):
-            result = future.result()
-            if result:
-                data.append(result)
-
-    # Create DataFrame and deduplicate
-    df = pd.DataFrame(data, columns=["full_weblink", "main_body_text"])
-    df = df.drop_duplicates(subset="main_body_text", keep="first")
-    df.index.name = "index"
+    # Don't download images, archives and other binaries linked from docs
+    if content_type and not any(
+        scraped_type in content_type for scraped_type in SCRAPED_CONTENT_TYPES
+    ):
+        return None
 
-    return df, failed_pages
+    if "application/pdf" in content_type:
+        if not scrape_pdfs:
+            return "PDF content skipped as per user preference.", []
+
+        # Truncating is fine for HTML but leaves a PDF that can't be opened, so
+        # oversized PDFs are skipped whole; the extra byte tells a body that
+        # hit the limit apart from one that fits exactly
+        content_length = response.headers.get("Content-Length", "")
+        too_large = (
+            content_length.isdigit() and int(content_length) > MAX_RESPONSE_BYTES
+        )
+        if not too_large:
+            content = read_body(response, MAX_RESPONSE_BYTES + 1)
+            too_large = len(content) > MAX_RESPONSE_BYTES
+        if too_large:
+            return (
+                f"PDF content skipped: larger than the "
+                f"{MAX_RESPONSE_BYTES // (1024 * 1024)} MiB download limit.",
+                [],
+            )
+        return extract_text(content, content_type)
 
+    declared_encoding = response.encoding if "charset=" in content_type else None
+    content = read_body(response)
 
-@st.cache_resource
-def get_page_text(url):
-    response = requests.get(url, timeout=10)
-    response.raise_for_status()
+    # Relative links resolve against the URL actually served (after redirects),
+    # which keeps the trailing slash normalize_url strips
+    return extract_text(content, content_type, declared_encoding, response.url)
 
-    content_type = response.headers.get("Content-Type", "").lower()
 
+# Returns (page_text, hrefs) from an already downloaded body; no network access.
+# hrefs are made absolute against base_url when it is given
+def extract_text(content, content_type, encoding=None, base_url=None):
     if "application/pdf" in content_type:
-        if scrape_pdfs:
-            # Handle PDF content
-            pdf_content = response.content
-            pdf_document = fitz.open(stream=pdf_content, filetype="pdf")
-            text = ""
-            for page in pdf_document:
-                text += page.get_text()
+        # Handle PDF content with the plain "text" extractor, joining pages once
+        pdf_document = fitz.open(stream=content, filetype="pdf")
+        try:
+            text = "".join(page.get_text("text") for page in pdf_document)
+        finally:
             pdf_document.close()
-            return text
-        else:
-            return "PDF content skipped as per user preference."
+        return text, []
     else:
-        # Handle HTML content (existing code)
-        detected_encoding = chardet.detect(response.content)["encoding"]
-
+        # Handle HTML content with lxml directly: hrefs come back from XPath as
+        # plain strings. The HTTP-declared charset is used when it is known
+        parser = None
+        if encoding:
+            try:
+                parser = lxml.html.HTMLParser(encoding=encoding)
+            except LookupError:
+                # Unknown charset in the header; detect it below instead
+                pass
+        if parser is None:
+            # Without a charset libxml2 assumes Latin-1 unless the page has a
+            # <meta charset>, so check for UTF-8 first and otherwise use
+            # windows-1252, the HTML default for undeclared documents. That
+            # decode happens here because libxml2's stops at the bytes
+            # windows-1252 leaves undefined and drops the rest of the page
+            try:
+                content.decode("utf-8")
+                parser = lxml.html.HTMLParser(encoding="utf-8")
+            except UnicodeDecodeError:
+                if not META_CHARSET_PATTERN.search(content, 0, 4096):
+                    content = content.decode("cp1252", errors="replace").encode()
+                    parser = lxml.html.HTMLParser(encoding="utf-8")
         try:
-            decoded_content = response.content.decode(detected_encoding or "utf-8")
-        except UnicodeDecodeError:
-            decoded_content = response.content.decode("utf-8", errors="replace")
-
-        soup = BeautifulSoup(decoded_content, "html.parser")
-        for script in soup(["script", "style"]):
-            script.extract()
-        text = soup.get_text(" ", strip=True)
-        return text
+            root = lxml.html.document_fromstring(content, parser=parser)
+        except etree.ParserError:
+            # Empty document, e.g. only whitespace, a comment or a doctype
+            return "", []
+        hrefs = root.xpath("//a/@href")
+        if base_url:
+            hrefs = [urljoin(base_url, href) for href in hrefs]
+        # Remove scripts, styles and comments (keeping their tail text) in one
+        # pass over the tree
+        etree.strip_elements(root, "script", "style", etree.Comment, with_tail=False)
+        # Same output as BeautifulSoup's get_text(" ", strip=True)
+        text = " ".join(
+            stripped for stripped in (s.strip() for s in root.itertext()) if stripped
+        )
+        return text, hrefs
+
+
+# Drop pages that are near-copies of an earlier page. Docs sites repeat the
+# same navigation and footers, so pages differing by a few words slip past
+# the exact body dedup in crawl_and_scrape.
+def remove_near_duplicates(df, threshold=0.85, num_perm=128):
+    lsh = MinHashLSH(threshold=threshold, num_perm=num_perm)
+    keep = []
+    for position, text in enumerate(df["main_body_text"]):
+        minhash = MinHash(num_perm=num_perm)
+        shingles = {text[i : i + 3] for i in range(len(text) - 2)}
+        minhash.update_batch([shingle.encode("utf-8") for shingle in shingles])
+        if lsh.query(minhash):
+            continue
+        lsh.insert(str(position), minhash)
+        keep.append(position)
+    return df.iloc[keep]
 
 
 st.title("Protocol Documentation Scraper")
@@ -229,8 +378,8 @@ st.write("""
          https://aistudio.google.com, due to its high context window, is recommended as an LLM to paste large amount of text in 🙂
          """)
 
-# Create two columns for checkboxes
-col1, col2 = st.columns(2)
+# Create three columns for checkboxes
+col1, col2, col3 = st.columns(3)
 
 # Add toggle for text preview in the first column
 with col1:
@@ -240,6 +389,21 @@ with col1:
 with col2:
     scrape_pdfs = st.checkbox("Scrape PDFs", value=True)
 
+# Add toggle for near-duplicate removal in the third column
+with col3:
+    remove_near_dupes = st.checkbox(
+        "Remove near-duplicates",
+        value=False,
+        disabled=MinHash is None,
+        help="Requires the optional datasketch package" if MinHash is None else None,
+    )
+
+# Fetches are IO-bound, so well above the CPU count is fine; lower it for
+# hosts that rate-limit
+concurrency = st.slider(
+    "Concurrent requests", min_value=1, max_value=32, value=CRAWL_CONCURRENCY
+)
+
 root_url = st.text_input("Enter Root Domain (e.g., https://docs.polymarket.com/)", "")
 
 if "df" not in st.session_state:
@@ -249,7 +413,11 @@ if st.button("Scrape"):
     if root_url:
         with st.spinner("Crawling, scraping, and deduplicating..."):
             start_time = time.time()
-            st.session_state.df, failed_pages = crawl_and_scrape(root_url)
+            st.session_state.df, failed_pages = crawl_and_scrape(
+                root_url, concurrency=concurrency, scrape_pdfs=scrape_pdfs
+            )
+            if remove_near_dupes:
+                st.session_state.df = remove_near_duplicates(st.session_state.df)
             st.success("Crawling, scraping, and deduplication complete!")
             st.success(f"Total time: {time.time() - start_time:.2f} seconds")
 
@@ -272,34 +440,41 @@ if st.session_state.df is not None:
     file_name_txt = f"{cleaned_url}_{str(round(time.time()))}.txt"
     file_name_json = f"{cleaned_url}_{str(round(time.time()))}.json"
 
-    csv = st.session_state.df.to_csv().encode("utf-8")
-    st.download_button(
-        label="Download Data as CSV",
-        data=csv,
-        file_name=file_name_csv,
-        mime="text/csv",
-    )
-
+    # The text is built once and shared by the txt download, preview and
+    # clipboard; CSV and JSON are only built for the format picked here
     all_text = "\n".join(st.session_state.df["main_body_text"])
-    txt = all_text.encode("utf-8")
-    st.download_button(
-        label="Download Data as txt file",
-        data=txt,
-        file_name=file_name_txt,
-        mime="text/plain",
+    download_format = st.radio(
+        "Download format", ["txt", "CSV", "JSON"], horizontal=True
     )
 
-    # New button for JSON download
-    json_data = st.session_state.df.set_index("full_weblink")[
-        "main_body_text"
-    ].to_dict()
-    json_str = json.dumps(json_data, ensure_ascii=False, indent=2)
-    st.download_button(
-        label="Download Data as JSON",
-        data=json_str,
-        file_name=file_name_json,
-        mime="application/json",
-    )
+    if download_format == "CSV":
+        st.download_button(
+            label="Download Data as CSV",
+            data=st.session_state.df.to_csv(),
+            file_name=file_name_csv,
+            mime="text/csv",
+        )
+    elif download_format == "JSON":
+        json_data = dict(
+            zip(
+                st.session_state.df["full_weblink"],
+                st.session_state.df["main_body_text"],
+            )
+        )
+        json_bytes = orjson.dumps(json_data, option=orjson.OPT_INDENT_2)
+        st.download_button(
+            label="Download Data as JSON",
+            data=json_bytes,
+            file_name=file_name_json,
+            mime="application/json",
+        )
+    else:
+        st.download_button(
+            label="Download Data as txt file",
+            data=all_text,
+            file_name=file_name_txt,
+            mime="text/plain",
+        )
 
     if show_preview:
         st.text_area("Text to be copied:", all_text, height=150, key="copy_text")